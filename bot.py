@@ -1,11 +1,21 @@
-import json
 import os
-import requests
+import re
+import math
+import atexit
+import logging
+import time
+from bisect import bisect_left, bisect_right, insort
 import asyncio
-import nest_asyncio
-from http.server import BaseHTTPRequestHandler, HTTPServer
-from threading import Thread
+import aiohttp
+import aiofiles
+import aiofiles.os
+import orjson
+from dataclasses import dataclass
+from functools import lru_cache
+from aiohttp import web
+from yarl import URL
 from telegram import Update
+from telegram.error import BadRequest, Forbidden, RetryAfter
 from telegram.ext import (
     ApplicationBuilder,
     CommandHandler,
@@ -18,25 +28,168 @@ from dotenv import load_dotenv
 # Load environment variables
 load_dotenv()
 
+# Logging; set LOG_LEVEL=WARNING to silence routine messages
+logging.basicConfig(
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    level=os.getenv("LOG_LEVEL", "INFO").upper(),
+)
+logging.getLogger("httpx").setLevel(logging.WARNING)  # PTB logs every getUpdates call at INFO
+logger = logging.getLogger(__name__)
+
 # File to store alerts
 ALERT_FILE = 'prices.json'
 
+@dataclass(slots=True)
+class Alert:
+    coin: str
+    symbol: str
+    price: float
+    direction: str  # "above" or "below"
+
 def load_alerts():
-    if os.path.exists(ALERT_FILE):
-        with open(ALERT_FILE, 'r') as f:
-            return json.load(f)
-    return {}
+    try:
+        with open(ALERT_FILE, 'rb') as f:
+            data = orjson.loads(f.read())
+    except FileNotFoundError:
+        return {}
+    except orjson.JSONDecodeError:
+        logger.error("Ignoring unreadable %s", ALERT_FILE, exc_info=True)
+        return {}
+    if not isinstance(data, dict):
+        logger.error("Ignoring %s: expected an object, got %r", ALERT_FILE, data)
+        return {}
+    # orjson writes Alert dataclasses back out as plain dicts; a bad record
+    # (e.g. a price saved as null) is skipped so the bot can still start
+    alerts = {}
+    for user_id, user_alerts in data.items():
+        if not isinstance(user_alerts, list):
+            logger.warning("Skipping malformed alerts for %s: %r", user_id, user_alerts)
+            continue
+        for a in user_alerts:
+            try:
+                alert = Alert(a["coin"], a["symbol"], float(a["price"]), a.get("direction", "above"))
+            except (KeyError, TypeError, ValueError, AttributeError):
+                alert = None
+            if (alert is None or not math.isfinite(alert.price) or alert.price <= 0
+                    or alert.direction not in ("above", "below")):
+                logger.warning("Skipping malformed alert for %s: %r", user_id, a)
+                continue
+            alerts.setdefault(user_id, []).append(alert)
+    return alerts
+
+async def save_alerts(data):
+    tmp = ALERT_FILE + '.tmp'
+    async with aiofiles.open(tmp, 'wb') as f:
+        await f.write(orjson.dumps(data))
+        await f.flush()
+        await asyncio.to_thread(os.fsync, f.fileno())  # data on disk before the swap
+    await aiofiles.os.replace(tmp, ALERT_FILE)
+
+# Alerts live in memory; the file is only written by the flusher
+STATE = load_alerts()
+_dirty = asyncio.Event()
+
+# Coin id -> direction -> [(user_id, alert)] sorted by alert price, so the
+# alerts a price triggers form a slice found by bisection
+COIN_INDEX: dict[str, dict[str, list[tuple[str, Alert]]]] = {}
+
+def _threshold(ref: tuple[str, Alert]) -> float:
+    return ref[1].price
+
+def _index_alert(user_id: str, alert: Alert):
+    bucket = COIN_INDEX.setdefault(alert.coin, {}).setdefault(alert.direction, [])
+    insort(bucket, (user_id, alert), key=_threshold)
+
+# Prices from the last check that fired nothing; scanning them again can
+# only fire if an alert was added since, so store_alert resets it
+_quiet_prices: dict | None = None
+
+def store_alert(user_id: str, alert: Alert):
+    global _quiet_prices
+    _quiet_prices = None
+    STATE.setdefault(user_id, []).append(alert)
+    _index_alert(user_id, alert)
+    _dirty.set()
+
+# Remove (user_id, alert) pairs in one pass over each affected list;
+# alerts already removed elsewhere are skipped
+def drop_alerts(pairs: list[tuple[str, Alert]]):
+    gone = {id(alert) for _, alert in pairs}
+    for user_id in {user_id for user_id, _ in pairs}:
+        keep = [a for a in STATE.get(user_id, []) if id(a) not in gone]
+        if keep:
+            STATE[user_id] = keep
+        else:
+            STATE.pop(user_id, None)
+    for coin in {alert.coin for _, alert in pairs}:
+        buckets = COIN_INDEX.get(coin, {})
+        for direction, refs in list(buckets.items()):
+            keep = [ref for ref in refs if id(ref[1]) not in gone]
+            if keep:
+                buckets[direction] = keep
+            else:
+                del buckets[direction]
+        if not buckets:
+            COIN_INDEX.pop(coin, None)
+    _dirty.set()
+
+def drop_alert(user_id: str, alert: Alert):
+    drop_alerts([(user_id, alert)])
 
-def save_alerts(data):
-    with open(ALERT_FILE, 'w') as f:
-        json.dump(data, f, indent=2)
+for _user_id, _user_alerts in STATE.items():
+    for _alert in _user_alerts:
+        _index_alert(_user_id, _alert)
 
-# Your Telegram bot token and ping URL
+# Seconds to wait after a change before writing alerts to disk
+FLUSH_DELAY = 2
+
+async def flusher():
+    while True:
+        await _dirty.wait()
+        await asyncio.sleep(FLUSH_DELAY)  # collect further changes into one write
+        _dirty.clear()
+        try:
+            await save_alerts(STATE)
+        except asyncio.CancelledError:
+            _dirty.set()  # shutdown writes it instead
+            raise
+        except Exception:
+            logger.error("Error saving alerts", exc_info=True)
+            _dirty.set()
+
+# Last-chance synchronous write if the process exits without post_shutdown
+@atexit.register
+def _flush_on_exit():
+    if _dirty.is_set():
+        tmp = ALERT_FILE + '.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(orjson.dumps(STATE))
+            f.flush()
+            os.fsync(f.fileno())  # data on disk before the swap
+        os.replace(tmp, ALERT_FILE)
+
+# Your Telegram bot token
 BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
-PING_URL = os.getenv("PING_URL")  # Example: "https://your-app-url.onrailway.app"
+
+# CoinGecko simple price endpoint
+PRICE_URL = "https://api.coingecko.com/api/v3/simple/price"
+
+# /add arguments: COIN PRICE [above|below], matched on the lowercased text
+ADD_RE = re.compile(r"([a-z0-9]+)\s+(\d+(?:\.\d*)?|\.\d+)(?:\s+(above|below))?")
+
+# Seconds between alert checks
+CHECK_INTERVAL = int(os.getenv("CHECK_INTERVAL", "30"))
+
+# Seconds between alert evaluations against the last polled prices
+EVALUATE_INTERVAL = 5
+
+# Seconds a CoinGecko response is reused before fetching again; kept
+# below CHECK_INTERVAL so every check still sees a fresh price
+PRICE_TTL = min(15, CHECK_INTERVAL - 1)
 
 # Allowed users
 ALLOWED_USERS = {5817239686, 5274796002}
+AUTH = filters.User(user_id=ALLOWED_USERS)
 
 # Symbol to CoinGecko ID map
 SYMBOL_MAP = {
@@ -52,242 +205,444 @@ SYMBOL_MAP = {
     "degen": "degen-base",
 }
 
+# CoinGecko ID to symbol map
+COIN_TO_SYMBOL = {v: k for k, v in SYMBOL_MAP.items()}
+
+# Display form of each symbol
+SYMBOLS_UPPER = {k: k.upper() for k in SYMBOL_MAP}
+
+def symbol_label(symbol: str) -> str:
+    return SYMBOLS_UPPER.get(symbol) or symbol.upper()  # stored coins may have left SYMBOL_MAP
+
+# Static replies, built once
+START_TEXT = (
+    "👋 Welcome to Crypto Alert Bot!\n\n"
+    "Use <b><i>/add COIN PRICE</i></b> or <b><i>/add COIN PRICE below</i></b> - to set a price alert.\n\n"
+    "Examples:\n"
+    "<b><i>/add BTC 100000</i></b>\n"
+    "<b><i>/add BTC 100000 below</i></b>\n\n"
+    "Use <b><i>/help</i></b> for all commands."
+)
+
+HELP_TEXT = (
+    "📌 Commands:\n"
+    "/start - Start the bot\n"
+    "/add COIN PRICE [above|below] - Set alert\n"
+    "/list - List alerts\n"
+    "/remove NUMBER - Remove alert\n"
+    "/coin - Show available coins\n"
+    "/price COIN [COIN2 ...] - Get current prices\n"
+    "/help - Show this help\n"
+)
+
+COIN_REPLY_TEXT = (
+    "<b>📊 Coins:</b>\n"
+    + "\n".join(f"• {SYMBOLS_UPPER[k]} ({v})" for k, v in SYMBOL_MAP.items())
+    + "\n\n"
+    "Use /add COIN PRICE [above|below] to set an alert.\n"
+    "Example: /add btc 50000 below\n"
+)
+
+USAGE_ADD_TEXT = "❗ Usage: /add COIN PRICE [above|below]\nExample: /add btc 30000 below"
+USAGE_REMOVE_TEXT = "❗ Usage: /remove ALERT_NUMBER"
+USAGE_PRICE_TEXT = "❗ Usage: /price COIN [COIN2 ...]"
+UNAUTH_TEXT = "❌ Sorry, you are not authorized to use this bot."
+UNKNOWN_TEXT = "❌ Unknown command. Use /help for help."
+
+# Attempts per CoinGecko request before giving up
+PRICE_RETRIES = 3
+
+# Seconds all attempts of one CoinGecko request may take together, kept well
+# below CHECK_INTERVAL so a failing poll ends before the next one is due
+FETCH_BUDGET = min(15, CHECK_INTERVAL / 2)
+
+# Failures a CoinGecko request can end with; ValueError covers
+# orjson.JSONDecodeError and a body that isn't a JSON object
+FETCH_ERRORS = (aiohttp.ClientError, asyncio.TimeoutError, ValueError)
+
+# Cached CoinGecko prices: coin id -> (fetched at, {"usd": price})
+_price_cache: dict[str, tuple[float, dict]] = {}
+
+# Downloads in progress: sorted ids -> task, so overlapping callers share one
+_inflight: dict[tuple[str, ...], asyncio.Task] = {}
+
+async def fetch_prices(session: aiohttp.ClientSession, ids) -> dict:
+    now = time.monotonic()
+    prices, missing = {}, []
+    for coin in set(ids):
+        cached = _price_cache.get(coin)
+        if cached and now - cached[0] < PRICE_TTL:
+            prices[coin] = cached[1]
+        else:
+            missing.append(coin)
+    if not missing:
+        return prices
+
+    key = tuple(sorted(missing))
+    task = next((t for k, t in _inflight.items() if set(key).issubset(k)), None)
+    if task is None:
+        task = asyncio.create_task(_download_prices(session, key))
+        _inflight[key] = task
+        task.add_done_callback(lambda _: _inflight.pop(key, None))
+    data = await asyncio.shield(task)
+    prices.update((coin, data[coin]) for coin in key if coin in data)
+    return prices
+
+# Request URL per id set, built and parsed once; CoinGecko ids need no quoting
+@lru_cache(maxsize=64)
+def price_url(key: tuple[str, ...]) -> URL:
+    return URL(f"{PRICE_URL}?ids={','.join(key)}&vs_currencies=usd", encoded=True)
+
+# Seconds to wait before retrying after a failed attempt, or None when
+# another attempt can't help (4xx other than 429, a malformed body)
+def _retry_delay(e: Exception, attempt: int) -> float | None:
+    if isinstance(e, aiohttp.ClientResponseError):
+        if e.status == 429:
+            try:
+                return float(e.headers["Retry-After"])
+            except (TypeError, KeyError, ValueError):
+                return None
+        if e.status < 500:
+            return None
+    elif not isinstance(e, (aiohttp.ClientConnectionError, aiohttp.ClientPayloadError,
+                            asyncio.TimeoutError)):
+        return None
+    return 2 ** attempt  # back off 1s, 2s, ...
+
+async def _download_prices(session: aiohttp.ClientSession, key: tuple[str, ...]) -> dict:
+    deadline = time.monotonic() + FETCH_BUDGET
+    for attempt in range(PRICE_RETRIES):
+        timeout = aiohttp.ClientTimeout(total=min(10, deadline - time.monotonic()))
+        try:
+            async with session.get(price_url(key), timeout=timeout) as r:
+                r.raise_for_status()  # don't cache a rate-limit error body as prices
+                data = orjson.loads(await r.read())
+            if not isinstance(data, dict):
+                raise ValueError(f"Unexpected CoinGecko response: {data!r:.100}")
+            break
+        except FETCH_ERRORS as e:
+            delay = _retry_delay(e, attempt)
+            if (delay is None or attempt == PRICE_RETRIES - 1
+                    or time.monotonic() + delay >= deadline):
+                raise
+            await asyncio.sleep(delay)
+    fetched_at = time.monotonic()
+    for coin, entry in data.items():
+        _price_cache[coin] = (fetched_at, entry)
+    return data
+
+# Paces callers to `rate` acquisitions per second with bursts up to `capacity`
+class AsyncTokenBucket:
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+# Telegram allows ~30 msg/s per bot and ~1 msg/s per chat
+_send_bucket = AsyncTokenBucket(rate=25, capacity=25)
+_chat_buckets: dict[int, AsyncTokenBucket] = {}
+
+async def send_alert(bot, chat_id: int, text: str):
+    chat_bucket = _chat_buckets.get(chat_id)
+    if chat_bucket is None:
+        chat_bucket = _chat_buckets[chat_id] = AsyncTokenBucket(rate=1, capacity=1)
+    await chat_bucket.acquire()
+    await _send_bucket.acquire()
+    try:
+        return await bot.send_message(chat_id=chat_id, text=text)
+    except RetryAfter as e:
+        await asyncio.sleep(e.retry_after)
+        return await bot.send_message(chat_id=chat_id, text=text)
+
+# Schedule the price poll and alert check jobs unless they are already running
+def ensure_check_job(job_queue, first=5):
+    if not job_queue.get_jobs_by_name("poll_prices"):
+        job_queue.run_repeating(poll_prices, interval=CHECK_INTERVAL, first=first, name="poll_prices")
+    if not job_queue.get_jobs_by_name("check_prices"):
+        job_queue.run_repeating(check_prices, interval=EVALUATE_INTERVAL, first=first + 1, name="check_prices")
+
 # Commands
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    user_id = update.effective_user.id
-    if user_id not in ALLOWED_USERS:
-        return await update.message.reply_text("❌ Sorry, you are not authorized to use this bot.")
-    await update.message.reply_text(
-        "👋 Welcome to Crypto Alert Bot!\n\n"
-        "Use <b><i>/add COIN PRICE</i></b> or <b><i>/add COIN PRICE below</i></b> - to set a price alert.\n\n"
-        "Examples:\n"
-        "<b><i>/add BTC 100000</i></b>\n"
-        "<b><i>/add BTC 100000 below</i></b>\n\n"
-        "Use <b><i>/help</i></b> for all commands.",
-        parse_mode="HTML"
-    )
+    await update.message.reply_text(START_TEXT, parse_mode="HTML")
 
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    if update.effective_user.id not in ALLOWED_USERS:
-        return await update.message.reply_text("❌ You are not authorized.")
-    await update.message.reply_text(
-        "📌 Commands:\n"
-        "/start - Start the bot\n"
-        "/add COIN PRICE [above|below] - Set alert\n"
-        "/list - List alerts\n"
-        "/remove NUMBER - Remove alert\n"
-        "/coin - Show available coins\n"
-        "/price COIN [COIN2 ...] - Get current prices\n"
-        "/help - Show this help\n",
-        parse_mode="HTML"
-    )
+    await update.message.reply_text(HELP_TEXT, parse_mode="HTML")
 
 async def coin_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    if update.effective_user.id not in ALLOWED_USERS:
-        return await update.message.reply_text("❌ You are not authorized.")
-    coins = "\n".join([f"• {k.upper()} ({v})" for k, v in SYMBOL_MAP.items()])
-    await update.message.reply_text(
-        f"<b>📊 Coins:</b>\n{coins}\n\n"
-        "Use /add COIN PRICE [above|below] to set an alert.\n"
-        "Example: /add btc 50000 below\n",
-        parse_mode="HTML"
-    )
+    await update.message.reply_text(COIN_REPLY_TEXT, parse_mode="HTML")
 
 async def add_alert(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
-    if user_id not in ALLOWED_USERS:
-        return await update.message.reply_text("❌ You are not authorized.")
+    m = ADD_RE.fullmatch(" ".join(context.args).lower())
+    if not m:
+        return await update.message.reply_text(USAGE_ADD_TEXT, parse_mode="HTML")
 
-    if len(context.args) < 2:
-        return await update.message.reply_text(
-            "❗ Usage: /add COIN PRICE [above|below]\nExample: /add btc 30000 below",
-            parse_mode="HTML"
-        )
-
-    symbol = context.args[0].lower()
+    symbol, price_text, direction = m.groups()
     coin = SYMBOL_MAP.get(symbol)
     if not coin:
         return await update.message.reply_text("❗ Unsupported coin.")
-
-    try:
-        price = float(context.args[1])
-    except ValueError:
+    price = float(price_text)
+    # ADD_RE only admits digits, but a long enough run still overflows to inf
+    if not math.isfinite(price) or price <= 0:
         return await update.message.reply_text("❗ Invalid price.")
+    direction = direction or "above"
 
-    direction = "above"
-    if len(context.args) >= 3 and context.args[2].lower() in ["above", "below"]:
-        direction = context.args[2].lower()
-
-    alerts = load_alerts()
-    user_alerts = alerts.get(str(user_id), [])
-    user_alerts.append({
-        "coin": coin,
-        "symbol": symbol,
-        "price": price,
-        "direction": direction
-    })
-    alerts[str(user_id)] = user_alerts
-    save_alerts(alerts)
+    store_alert(str(user_id), Alert(coin, symbol, price, direction))
+    ensure_check_job(context.job_queue)
 
-    await update.message.reply_text(f"✅ Alert set for {symbol.upper()} ${price} ({direction})")
+    await update.message.reply_text(f"✅ Alert set for {SYMBOLS_UPPER[symbol]} ${price} ({direction})")
+    if coin not in _last_prices:
+        # Coin missing from the last poll; fetch it now rather than at the next poll
+        context.application.create_task(poll_coin(context.application.bot_data["http"], coin))
 
 async def list_alerts(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
-    if user_id not in ALLOWED_USERS:
-        return await update.message.reply_text("❌ You are not authorized.")
-    alerts = load_alerts()
-    user_alerts = alerts.get(str(user_id), [])
+    user_alerts = STATE.get(str(user_id), [])
 
     if not user_alerts:
         return await update.message.reply_text("You have no active alerts.")
 
     msg = "📋 Your alerts:\n"
     for i, alert in enumerate(user_alerts, start=1):
-        msg += f"{i}. {alert['symbol'].upper()} {alert['direction']} ${alert['price']}\n"
+        msg += f"{i}. {symbol_label(alert.symbol)} {alert.direction} ${alert.price}\n"
     await update.message.reply_text(msg)
 
 async def remove_alert(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
-    if user_id not in ALLOWED_USERS:
-        return await update.message.reply_text("❌ You are not authorized.")
 
     if len(context.args) != 1 or not context.args[0].isdigit():
-        return await update.message.reply_text("❗ Usage: /remove ALERT_NUMBER")
+        return await update.message.reply_text(USAGE_REMOVE_TEXT)
 
     idx = int(context.args[0]) - 1
-    alerts = load_alerts()
-    user_alerts = alerts.get(str(user_id), [])
+    user_alerts = STATE.get(str(user_id), [])
 
     if idx < 0 or idx >= len(user_alerts):
         return await update.message.reply_text("❗ Invalid alert number.")
 
-    removed = user_alerts.pop(idx)
-    if user_alerts:
-        alerts[str(user_id)] = user_alerts
-    else:
-        alerts.pop(str(user_id))
-    save_alerts(alerts)
+    removed = user_alerts[idx]
+    drop_alert(str(user_id), removed)
     await update.message.reply_text(
-        f"✅ Removed alert for {removed['symbol'].upper()} ${removed['price']} ({removed['direction']})"
+        f"✅ Removed alert for {symbol_label(removed.symbol)} ${removed.price} ({removed.direction})"
     )
 
 async def get_price(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    if update.effective_user.id not in ALLOWED_USERS:
-        return await update.message.reply_text("❌ You are not authorized.")
     if not context.args:
-        return await update.message.reply_text("❗ Usage: /price COIN [COIN2 ...]")
-
-    symbols = [s.lower() for s in context.args]
-    unknown = [s for s in symbols if s not in SYMBOL_MAP]
+        return await update.message.reply_text(USAGE_PRICE_TEXT)
+
+    # Resolve symbols and collect unknown ones in a single pass
+    pairs, unknown = [], []
+    for s in context.args:
+        s = s.lower()
+        coin = SYMBOL_MAP.get(s)
+        if coin is None:
+            unknown.append(s)
+        else:
+            pairs.append((s, coin))
     if unknown:
         return await update.message.reply_text(f"❗ Unknown coin(s): {', '.join(unknown)}")
 
-    ids = [SYMBOL_MAP[s] for s in symbols]
+    session = context.application.bot_data["http"]
     try:
-        res = requests.get("https://api.coingecko.com/api/v3/simple/price",
-                           params={"ids": ",".join(ids), "vs_currencies": "usd"}).json()
-        lines = []
-        for s in symbols:
-            price = res.get(SYMBOL_MAP[s], {}).get("usd")
-            if price is not None:
-                lines.append(f"💰 {s.upper()}: ${price:.5f}")
-            else:
-                lines.append(f"⚠️ {s.upper()}: Price not found")
-        await update.message.reply_text("\n".join(lines))
-    except Exception as e:
-        print("Error fetching prices:", e)
-        await update.message.reply_text("⚠️ Failed to fetch prices.")
+        res = await fetch_prices(session, [coin for _, coin in pairs])
+    except FETCH_ERRORS:
+        logger.error("Error fetching prices", exc_info=True)
+        return await update.message.reply_text("⚠️ Failed to fetch prices.")
+
+    lines = []
+    for s, coin in pairs:
+        price = res.get(coin, {}).get("usd")
+        if price is not None:
+            lines.append(f"💰 {SYMBOLS_UPPER[s]}: ${price:.5f}")
+        else:
+            lines.append(f"⚠️ {SYMBOLS_UPPER[s]}: Price not found")
+    await update.message.reply_text("\n".join(lines))
+
+# Latest prices from poll_prices and when they were fetched
+_last_prices: dict = {}
+_last_polled = 0.0
+
+async def poll_prices(context: ContextTypes.DEFAULT_TYPE):
+    global _last_prices, _last_polled
+    if not COIN_INDEX:
+        # Nothing to watch; /add schedules the job again
+        context.job.schedule_removal()
+        return
 
-async def check_prices(context: ContextTypes.DEFAULT_TYPE):
-    alerts = load_alerts()
-    if not alerts:
+    session = context.application.bot_data["http"]
+    try:
+        prices = await fetch_prices(session, list(COIN_INDEX))
+    except FETCH_ERRORS:
+        logger.error("Error fetching prices", exc_info=True)
         return
+    if prices:
+        _last_prices, _last_polled = prices, time.monotonic()
 
-    coins = list({alert['coin'] for alerts in alerts.values() for alert in alerts})
+# Add one coin to the last polled prices so check_prices covers it
+async def poll_coin(session: aiohttp.ClientSession, coin: str):
+    global _last_prices
     try:
-        prices = requests.get(
-            "https://api.coingecko.com/api/v3/simple/price",
-            params={"ids": ",".join(coins), "vs_currencies": "usd"}
-        ).json()
-    except Exception as e:
-        print("Error fetching prices:", e)
+        prices = await fetch_prices(session, [coin])
+    except FETCH_ERRORS:
+        logger.warning("Error fetching %s; it waits for the next poll", coin, exc_info=True)
         return
+    if coin in prices:
+        _last_prices = {**_last_prices, **prices}  # new dict, so _quiet_prices won't match
 
-    for user_id, user_alerts in list(alerts.items()):
-        to_remove = []
-        for i, alert in enumerate(user_alerts):
-            current = prices.get(alert["coin"], {}).get("usd")
-            if current is None:
-                continue
-            if (alert["direction"] == "above" and current >= alert["price"]) or \
-               (alert["direction"] == "below" and current <= alert["price"]):
-                await context.bot.send_message(
-                    chat_id=int(user_id),
-                    text=f"🚨 {alert['symbol'].upper()} is ${current:.5f}, hit {alert['direction']} ${alert['price']}!"
-                )
-                to_remove.append(i)
-        for i in reversed(to_remove):
-            user_alerts.pop(i)
-        if user_alerts:
-            alerts[user_id] = user_alerts
-        else:
-            alerts.pop(user_id)
-    save_alerts(alerts)
+async def check_prices(context: ContextTypes.DEFAULT_TYPE):
+    global _quiet_prices
+    if not COIN_INDEX:
+        context.job.schedule_removal()
+        return
 
-# ========== SELF-PINGING ==========
-async def ping_self():
-    while True:
-        try:
-            if PING_URL:
-                requests.get(PING_URL)
-                print("🔁 Pinged self")
-        except Exception as e:
-            print("Ping failed", e)
-        await asyncio.sleep(300)  # every 5 minutes
+    prices = _last_prices
+    # Don't fire on prices left over from a run of failed polls
+    if time.monotonic() - _last_polled > 2 * CHECK_INTERVAL:
+        return
+    if not prices or prices == _quiet_prices:
+        return
+
+    # Collect notifications first, then send them all at once
+    sends, fired = [], []
+    for coin, buckets in COIN_INDEX.items():
+        current = prices.get(coin, {}).get("usd")
+        if current is None:
+            continue
+        symbol = symbol_label(COIN_TO_SYMBOL.get(coin, coin))
+        above = buckets.get("above", [])
+        below = buckets.get("below", [])
+        # "above" fires for prices <= current, "below" for prices >= current
+        triggered = (
+            above[:bisect_right(above, current, key=_threshold)]
+            + below[bisect_left(below, current, key=_threshold):]
+        )
+        for user_id, alert in triggered:
+            sends.append(send_alert(
+                context.bot,
+                int(user_id),
+                f"🚨 {symbol} is ${current:.5f}, hit {alert.direction} ${alert.price}!"
+            ))
+            fired.append((user_id, alert))
+    if not sends:
+        _quiet_prices = prices
+        return
+
+    results = await asyncio.gather(*sends, return_exceptions=True)
+    done = []
+    for (user_id, alert), result in zip(fired, results):
+        if isinstance(result, (Forbidden, BadRequest)):
+            # Bot blocked or chat gone; retrying every tick would never succeed
+            logger.warning("Dropping alert for %s: %s", user_id, result)
+            done.append((user_id, alert))
+        elif isinstance(result, Exception):
+            logger.warning("Error sending alert to %s: %s", user_id, result)
+        else:
+            done.append((user_id, alert))  # transient failures are retried next tick
+    if done:
+        drop_alerts(done)  # skips any removed while sending
 
 # ========== SIMPLE SERVER ==========
-class PingHandler(BaseHTTPRequestHandler):
-    def do_GET(self):
-        self.send_response(200)
-        self.end_headers()
-        self.wfile.write(b"Pong")
-
-def run_ping_server():
-    def server_thread():
-        server = HTTPServer(('0.0.0.0', 10001), PingHandler)
-        server.serve_forever()
-    Thread(target=server_thread, daemon=True).start()
+# Point the host's healthcheck here instead of pinging ourselves
+async def pong(request: web.Request) -> web.Response:
+    return web.Response(text="Pong")
+
+async def start_ping_server(port: int = 10001) -> web.AppRunner:
+    server = web.Application()
+    server.router.add_get("/{tail:.*}", pong)
+    runner = web.AppRunner(server)
+    await runner.setup()
+    await web.TCPSite(runner, "0.0.0.0", port).start()
+    return runner
+
+# Commands from users outside ALLOWED_USERS
+async def unauthorized(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await update.message.reply_text(UNAUTH_TEXT)
 
 # Unknown command
 async def unknown_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    await update.message.reply_text("❌ Unknown command. Use /help for help.")
+    await update.message.reply_text(UNKNOWN_TEXT)
+
+# Open the shared HTTP session, ping server and flusher on the bot's event loop
+async def startup(app):
+    # One shared HTTP session for CoinGecko; keep the connection and DNS
+    # entry alive across check intervals so each tick skips the handshake
+    connector = aiohttp.TCPConnector(
+        limit_per_host=4, keepalive_timeout=CHECK_INTERVAL + 30, ttl_dns_cache=300
+    )
+    app.bot_data["http"] = aiohttp.ClientSession(
+        connector=connector, timeout=aiohttp.ClientTimeout(total=10)
+    )
+    app.bot_data["ping_server"] = await start_ping_server()
+    app.bot_data["flusher"] = asyncio.create_task(flusher())
+
+# Write pending alerts and close the HTTP session and ping server on shutdown;
+# also runs after a failed startup, so skip whatever wasn't created
+async def shutdown(app):
+    flusher_task = app.bot_data.get("flusher")
+    if flusher_task is not None:
+        flusher_task.cancel()
+        await asyncio.gather(flusher_task, return_exceptions=True)
+    if _dirty.is_set():
+        _dirty.clear()
+        try:
+            await save_alerts(STATE)
+        except Exception:
+            logger.error("Error saving alerts", exc_info=True)
+            _dirty.set()  # leave it to the atexit hook
+    ping_server = app.bot_data.get("ping_server")
+    if ping_server is not None:
+        await ping_server.cleanup()
+    session = app.bot_data.get("http")
+    if session is not None:
+        await session.close()
 
 # Main function
-async def main():
-    run_ping_server()  # Start the ping server in a separate thread
-    app = ApplicationBuilder().token(BOT_TOKEN).build()
-
-    app.add_handler(CommandHandler("start", start))
-    app.add_handler(CommandHandler("help", help_command))
-    app.add_handler(CommandHandler("coin", coin_command))
-    app.add_handler(CommandHandler("add", add_alert))
-    app.add_handler(CommandHandler("list", list_alerts))
-    app.add_handler(CommandHandler("remove", remove_alert))
-    app.add_handler(CommandHandler("price", get_price))
+def main():
+    app = (
+        ApplicationBuilder()
+        .token(BOT_TOKEN)
+        # Wait for a free connection during alert bursts instead of failing
+        # after the default 1s; the builder's 256-connection pool is kept
+        .pool_timeout(10)
+        .post_init(startup)
+        .post_shutdown(shutdown)
+        .build()
+    )
+
+    app.add_handler(MessageHandler(filters.COMMAND & ~AUTH, unauthorized))
+    app.add_handler(CommandHandler("start", start, filters=AUTH))
+    app.add_handler(CommandHandler("help", help_command, filters=AUTH))
+    app.add_handler(CommandHandler("coin", coin_command, filters=AUTH))
+    app.add_handler(CommandHandler("add", add_alert, filters=AUTH))
+    app.add_handler(CommandHandler("list", list_alerts, filters=AUTH))
+    app.add_handler(CommandHandler("remove", remove_alert, filters=AUTH))
+    app.add_handler(CommandHandler("price", get_price, filters=AUTH))
     app.add_handler(MessageHandler(filters.COMMAND, unknown_command))
 
-    app.job_queue.run_repeating(check_prices, interval=15, first=5)
-    asyncio.create_task(ping_self())
+    ensure_check_job(app.job_queue)
 
-    print("🤖 Bot is running...")
-    await app.run_polling()
+    logger.info("🤖 Bot is running...")
+    # Only messages are handled; hold each getUpdates open for up to 30s
+    app.run_polling(allowed_updates=[Update.MESSAGE], timeout=30)
 
 if __name__ == "__main__":
-    import asyncio
     try:
-        asyncio.run(main())
-    except RuntimeError:
-        import nest_asyncio
-        nest_asyncio.apply()
-        asyncio.run(main())
+        import uvloop
+    except ImportError:  # not available on Windows
+        pass
+    else:
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    main()